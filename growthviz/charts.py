@@ -103,23 +103,17 @@ def make_age_charts(df, mode):
     # Adds label, color, pattern and sort order columns to the dataframe based on the
     # age of each row in the dataframe
     def add_categories_to_frame(df_data, df_reference):
-        categories = []
-        colors = []
-        patterns = []
-        sort_order = []
-        for j in range(len(df_data)):
-            for i in range(len(df_reference)):
-                minVal = df_reference["min"][i]
-                maxVal = df_reference["max"][i]
-                if df_data["ageyears"][j] >= minVal and df_data["ageyears"][j] < maxVal:
-                    categories.append(df_reference["label"][i])
-                    colors.append(df_reference["color"][i])
-                    patterns.append(df_reference["symbol"][i])
-                    sort_order.append(df_reference["sort_order"][i])
-        df_data["category"] = categories
-        df_data["colors"] = colors
-        df_data["patterns"] = patterns
-        df_data["sort_order"] = sort_order
+        # Ranges are contiguous, so bucket every age at once on the range boundaries,
+        # with each range including its min and excluding its max. Ages outside all
+        # of the ranges get a position of -1, which matches no range.
+        bins = np.append(df_reference["min"].to_numpy(), df_reference["max"].iloc[-1])
+        positions = np.searchsorted(bins, df_data["ageyears"].to_numpy(), side="right")
+        positions = np.where(positions < len(bins), positions - 1, -1)
+        ranges = df_reference.reindex(positions)
+        df_data["category"] = ranges["label"].to_numpy()
+        df_data["colors"] = ranges["color"].to_numpy()
+        df_data["patterns"] = ranges["symbol"].to_numpy()
+        df_data["sort_order"] = ranges["sort_order"].to_numpy()
         return df_data
 
     # Call the categorizing function on the data
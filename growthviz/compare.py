@@ -2,6 +2,20 @@ import numpy as np
 import pandas as pd
 
 
+def _zero_diff_last(diff):
+    """
+    Sort key for a run comparison "diff" column that places categories with no change
+    between runs after all of the categories that did change
+
+    Parameters:
+    diff: (Series) difference in values between two runs
+
+    Returns:
+    Series with zero differences replaced by negative infinity
+    """
+    return diff.astype(float).mask(diff == 0, -np.inf)
+
+
 def prepare_for_comparison(frame_dict):
     """
     This is the function that should be used when planning on comparing multiple runs to one another.
@@ -31,18 +45,12 @@ def count_comparison(combined_df):
     Returns:
     A DataFrame where the categories are the index and the columns are the run names.
     """
-    grouped = (
-        combined_df.groupby(["run_name", "clean_value"])
-        .agg({"id": "count"})
-        .reset_index()
-        .pivot(index="clean_value", columns="run_name", values="id")
+    grouped = combined_df.value_counts(["run_name", "clean_value"]).unstack(
+        "run_name", fill_value=0
     )
-    grouped = grouped.fillna(0)
     if grouped.columns.size == 2:
         grouped["diff"] = grouped[grouped.columns[1]] - grouped[grouped.columns[0]]
-        grouped["tmp_sort"] = grouped["diff"].replace(0, np.NINF)
-        grouped = grouped.sort_values("tmp_sort", ascending=False)
-        grouped = grouped.drop(columns=["tmp_sort"])
+        grouped = grouped.sort_values("diff", ascending=False, key=_zero_diff_last)
     return grouped.style.format("{:.0f}")
 
 
@@ -57,22 +65,19 @@ def subject_comparison_category_counts(combined_df):
     Returns:
     A DataFrame where the categories are the index and the columns are the run names.
     """
-    grouped = (
-        combined_df.groupby(["run_name", "clean_value"])
-        .agg({"subjid": "nunique"})
-        .reset_index()
-        .pivot(index="clean_value", columns="run_name", values="subjid")
-    )
-    grouped = grouped.fillna(0)
+    grouped = pd.crosstab(
+        combined_df["clean_value"],
+        combined_df["run_name"],
+        values=combined_df["subjid"],
+        aggfunc="nunique",
+    ).fillna(0)
     if grouped.columns.size == 2:
         grouped["diff"] = grouped[grouped.columns[1]] - grouped[grouped.columns[0]]
         grouped["population percent change"] = (
             (grouped[grouped.columns[1]] - grouped[grouped.columns[0]])
             / grouped[grouped.columns[1]].sum()
         ) * 100
-        grouped["tmp_sort"] = grouped["diff"].replace(0, np.NINF)
-        grouped = grouped.sort_values("tmp_sort", ascending=False)
-        grouped = grouped.drop(columns=["tmp_sort"])
+        grouped = grouped.sort_values("diff", ascending=False, key=_zero_diff_last)
         grouped = grouped.style.format(
             {
                 grouped.columns[0]: "{:.0f}",
@@ -95,22 +100,19 @@ def subject_comparison_percentage(combined_df):
     Returns:
     A DataFrame where the categories are the index and the columns are the run names.
     """
-    grouped = (
-        combined_df.groupby(["run_name", "clean_value"])
-        .agg({"subjid": "nunique"})
-        .reset_index()
-        .pivot(index="clean_value", columns="run_name", values="subjid")
-    )
-    grouped = grouped.fillna(0)
+    grouped = pd.crosstab(
+        combined_df["clean_value"],
+        combined_df["run_name"],
+        values=combined_df["subjid"],
+        aggfunc="nunique",
+    ).fillna(0)
     for c in grouped.columns:
         grouped[c] = (
             grouped[c] / combined_df[combined_df.run_name == c].subjid.nunique()
         ) * 100
     if grouped.columns.size == 2:
         grouped["diff"] = grouped[grouped.columns[1]] - grouped[grouped.columns[0]]
-        grouped["tmp_sort"] = grouped["diff"].replace(0, np.NINF)
-        grouped = grouped.sort_values("tmp_sort", ascending=False)
-        grouped = grouped.drop(columns=["tmp_sort"])
+        grouped = grouped.sort_values("diff", ascending=False, key=_zero_diff_last)
     return grouped.style.format("{:.2f}%")
 
 
@@ -5,6 +5,14 @@ import pandas as pd
 from scipy.stats import norm
 from IPython.display import FileLinks
 
+from .sumstats import prepare_pediatric_percentiles
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
 
 def setup_individual_obs_df(obs_df):
     """
@@ -17,24 +25,27 @@ def setup_individual_obs_df(obs_df):
     Returns:
     DataFrame with updated columns
     """
-    df = obs_df.copy()
-    df.rename(columns={"clean_res": "clean_value"}, inplace=True)
-    df["ageyears"] = df["agedays"] / 365.25
-    df["clean_cat"] = df["clean_value"].astype("category")
-    df["include"] = df.clean_value.eq("Include")
-    col_list = [
-        "id",
-        "subjid",
-        "agedays",
-        "ageyears",
-        "sex",
-        "param",
-        "measurement",
-        "clean_value",
-        "clean_cat",
-        "include",
-    ]
-    return df[col_list]
+    clean_col = "clean_res" if "clean_res" in obs_df.columns else "clean_value"
+    clean_value = obs_df[clean_col]
+    df = pd.DataFrame(
+        {
+            "id": obs_df["id"],
+            "subjid": obs_df["subjid"],
+            "agedays": obs_df["agedays"],
+            "ageyears": obs_df["agedays"] / 365.25,
+            "sex": obs_df["sex"],
+            "param": obs_df["param"].astype("category"),
+            "measurement": obs_df["measurement"],
+            "clean_value": clean_value,
+            "clean_cat": clean_value.astype("category"),
+            "include": clean_value.eq("Include"),
+        }
+    )
+    # Narrow the integer columns
+    for col in ["id", "sex"]:
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
 
 
 def setup_percentiles_adults(percentiles):
@@ -50,19 +61,24 @@ def setup_percentiles_adults(percentiles):
     # expand decade rows into one row per year
     pct = percentiles[
         percentiles["Age (All race and Hispanic-origin groups)"] != "20 and over"
-    ].copy()
-    pct.loc[pct["Age_low"] == 20, "Age_low"] = 18
-    range_col = pct.apply(lambda row: row.Age_high - row.Age_low + 1, axis=1)
-    pct = pct.assign(range=range_col.values)
-    dta = pd.DataFrame(
-        (np.repeat(pct.values, pct["range"], axis=0)), columns=pct.columns
-    )
-    dta["count"] = dta.groupby(["Sex", "Measure", "Age_low", "Age_high"]).cumcount()
-    dta["age"] = dta["Age_low"] + dta["count"]
+    ]
+    # Start the 20s decade at 18
+    age_low = pct["Age_low"].to_numpy()
+    age_low = np.where(age_low == 20, 18, age_low)
+    pct = pct.assign(Age_low=age_low, range=pct["Age_high"].to_numpy() - age_low + 1)
+    years = pct["range"].to_numpy()
+    rows = np.repeat(np.arange(len(pct)), years)
+    dta = pct.iloc[rows].reset_index(drop=True)
+    # Number the years within each expanded row
+    run_starts = np.repeat(np.cumsum(years) - years, years)
+    dta["age"] = dta["Age_low"].to_numpy() + (np.arange(len(dta)) - run_starts)
     # add standard deviation and other values
-    dta["sqrt"] = np.sqrt(pd.to_numeric(dta["Number of examined persons"]))
+    dta["sqrt"] = np.sqrt(dta["Number of examined persons"])
     dta["sd"] = dta["Standard error of the mean"] * dta["sqrt"]
-    dta["Sex"] = dta.Sex.replace("Male", 0).replace("Female", 1)
+    # Align to the growthcleanr values of 0 (male) and 1 (female)
+    dta["Sex"] = pd.Categorical(dta["Sex"], categories=["Male", "Female"]).codes.astype(
+        "int8"
+    )
     dta.rename(columns={"Measure": "param"}, inplace=True)
     dta.drop(
         columns=[
@@ -72,13 +88,11 @@ def setup_percentiles_adults(percentiles):
             "Standard error of the mean",
             "Age_high",
             "range",
-            "count",
             "Number of examined persons",
         ],
         inplace=True,
     )
     # smooth percentiles between X9-(X+1)1 (i.e., 29-31)
-    dta["decade"] = np.where(dta["age"] == (round(dta["age"].astype(float), -1)), 1, 0)
     mcol_list = [
         "Mean",
         "sd",
@@ -92,13 +106,13 @@ def setup_percentiles_adults(percentiles):
         "P90",
         "P95",
     ]
-    for col in mcol_list:
-        dta[col] = np.where(
-            (dta["decade"] == 1) & (dta["age"] < 110),
-            (dta[col] + dta[col].shift(1)) / 2,
-            dta[col],
-        )
-    dta.drop(columns={"decade"}, inplace=True)
+    ages = dta["age"].to_numpy()
+    smooth = (ages % 10 == 0) & (ages < 110)
+    values = dta[mcol_list].to_numpy(dtype=float)
+    previous = np.roll(values, 1, axis=0)
+    previous[0] = np.nan
+    values[smooth] = (values[smooth] + previous[smooth]) / 2
+    dta[mcol_list] = values
     col_list = ["param", "Sex", "age"] + mcol_list
     dta = dta.reindex(columns=col_list)
     return dta
@@ -117,6 +131,7 @@ def setup_percentiles_pediatrics_new():
     df_cdc = pd.read_csv(Path("growthviz-data/ext/growthfile_cdc_ext.csv.gz"))
     df_who = pd.read_csv(Path("growthviz-data/ext/growthfile_who.csv.gz"))
     df = df_cdc.merge(df_who, on=["agedays", "sex"], how="left")
+    df["sex"] = df["sex"].astype("int8")
 
     # Add weighting columns to support smoothing between 2-4yo
     df = df.assign(ageyears=lambda r: (r["agedays"] / 365.25))
@@ -130,6 +145,7 @@ def setup_percentiles_pediatrics_new():
     )
 
     PERCENTILES = [0.03, 0.05, 0.10, 0.25, 0.50, 0.75, 0.85, 0.90, 0.95, 0.97]
+    z_scores = norm.ppf(PERCENTILES)
 
     # Compute percentiles for the full set of vars
     for s in ["who", "cdc"]:
@@ -137,27 +153,38 @@ def setup_percentiles_pediatrics_new():
         if s == "cdc":
             pvars.append("bmi")
         for p in pvars:
-            for pct in PERCENTILES:
-                lvar = f"{s}_{p}_l"
-                mvar = f"{s}_{p}_m"
-                svar = f"{s}_{p}_s"
-                tvar = f"{s}_{p}_p{int(pct * 100)}"
-                df.loc[df[lvar] == 0, tvar] = df[mvar] * (df[svar] ** norm.ppf(pct))
-                df.loc[df[lvar] != 0, tvar] = df[mvar] * (
-                    1 + (df[lvar] * df[svar] * norm.ppf(pct))
-                ) ** (1 / df[lvar])
+            lms_l = df[f"{s}_{p}_l"].to_numpy()[:, np.newaxis]
+            lms_m = df[f"{s}_{p}_m"].to_numpy()[:, np.newaxis]
+            lms_s = df[f"{s}_{p}_s"].to_numpy()[:, np.newaxis]
+            tvars = [f"{s}_{p}_p{int(pct * 100)}" for pct in PERCENTILES]
+            # Silence the division by zero in the discarded L == 0 branch
+            with np.errstate(divide="ignore", invalid="ignore"):
+                df[tvars] = np.where(
+                    lms_l == 0,
+                    lms_m * (lms_s**z_scores),
+                    lms_m * (1 + (lms_l * lms_s * z_scores)) ** (1 / lms_l),
+                )
 
     # Add smoothed percentiles
+    ages = df["ageyears"].to_numpy()
+    who_ages = ages <= 2
+    mixed_ages = (ages > 2) & (ages < 4)
+    cdc_ages = ages >= 4
+    who_weight = df["whoweight"].to_numpy()
+    cdc_weight = df["cdcweight"].to_numpy()
     for p in ["ht", "wt"]:
         for pct in PERCENTILES:
-            cdc_var = f"cdc_{p}_p{int(pct * 100)}"
-            who_var = f"who_{p}_p{int(pct * 100)}"
-            s_var = f"s_{p}_p{int(pct * 100)}"
-            df.loc[df["ageyears"] <= 2, s_var] = df[who_var]
-            df.loc[df["ageyears"].between(2, 4, inclusive="neither"), s_var] = (
-                (df[who_var] * df["whoweight"]) + (df[cdc_var] * df["cdcweight"])
-            ) / 2
-            df.loc[df["ageyears"] >= 4, s_var] = df[cdc_var]
+            cdc_vals = df[f"cdc_{p}_p{int(pct * 100)}"].to_numpy()
+            who_vals = df[f"who_{p}_p{int(pct * 100)}"].to_numpy()
+            df[f"s_{p}_p{int(pct * 100)}"] = np.select(
+                [who_ages, mixed_ages, cdc_ages],
+                [
+                    who_vals,
+                    ((who_vals * who_weight) + (cdc_vals * cdc_weight)) / 2,
+                    cdc_vals,
+                ],
+                default=np.nan,
+            )
 
     return df
 
@@ -176,21 +203,20 @@ def split_percentiles_pediatrics(df):
     df.rename(columns={"ageyears": "age", "sex": "Sex"}, inplace=True)
     cols = ["Sex", "agedays", "age"]
 
-    ht_cols = cols.copy()
-    ht_cols.extend([col for col in df.columns if "s_ht_p" in col])
-    df_ht = df[ht_cols]
-    df_ht.columns = [c.replace("s_ht_p", "P") for c in df_ht]
-
-    wt_cols = cols.copy()
-    wt_cols.extend([col for col in df.columns if "s_wt_p" in col])
-    df_wt = df[wt_cols]
-    df_wt.columns = [c.replace("s_wt_p", "P") for c in df_wt]
-
-    bmi_cols = cols.copy()
-    bmi_cols.extend([col for col in df.columns if "s_bmi_p" in col])
-    df_bmi = df[bmi_cols]
-    df_bmi.columns = [c.replace("s_bmi_p", "P") for c in df_bmi]
-
+    prefixes = ["s_ht_p", "s_wt_p", "s_bmi_p"]
+    pct_cols = {prefix: [] for prefix in prefixes}
+    for col in df.columns:
+        for prefix in prefixes:
+            if col.startswith(prefix):
+                pct_cols[prefix].append(col)
+                break
+
+    df_ht, df_wt, df_bmi = (
+        df[cols + pct_cols[prefix]].rename(
+            columns={c: c.replace(prefix, "P") for c in pct_cols[prefix]}
+        )
+        for prefix in prefixes
+    )
     return (df_ht, df_wt, df_bmi)
 
 
@@ -202,7 +228,7 @@ def setup_percentiles_pediatrics(percentiles_file):
     percentiles: (str) CDC Growth Chart Percentile Data File
 
     Returns:
-    DataFrame with pediatrics percentiles
+    DataFrame with pediatrics percentiles, prepared for modified Z score calculations
     """
     percentiles = pd.read_csv(
         f"growthviz-data/ext/{percentiles_file}",
@@ -214,7 +240,7 @@ def setup_percentiles_pediatrics(percentiles_file):
             "L": float,
             "M": float,
             "S": float,
-            "Sex": int,
+            "Sex": "int8",
         },
     )
     percentiles["age"] = percentiles["Agemos"] / 12
@@ -222,7 +248,7 @@ def setup_percentiles_pediatrics(percentiles_file):
     # which uses a numeric value of 0 (male) or 1 (female).
     # This aligns things to the growthcleanr values
     percentiles["Sex"] = percentiles["Sex"] - 1
-    return percentiles
+    return prepare_pediatric_percentiles(percentiles)
 
 
 def keep_age_range(df, mode):
@@ -245,11 +271,13 @@ def keep_age_range(df, mode):
             cols_to_drop.append(extra_col)
     df = df.drop(columns=cols_to_drop)
     if mode == "adults":
-        return df[df["ageyears"].between(18, 80, inclusive="both")]
+        min_age, max_age = 18, 80
     elif mode == "pediatrics":
-        return df[df["ageyears"].between(0, 25, inclusive="both")]
+        min_age, max_age = 0, 25
     else:
         return df
+    ages = df["ageyears"].to_numpy()
+    return df[(ages >= min_age) & (ages <= max_age)]
 
 
 def setup_merged_df(obs_df):
@@ -263,46 +291,56 @@ def setup_merged_df(obs_df):
     Returns:
     DataFrame with merged data
     """
-    obs_df = obs_df.assign(height=obs_df["measurement"], weight=obs_df["measurement"])
-    obs_df.loc[obs_df.param == "WEIGHTKG", "height"] = np.NaN
-    obs_df.loc[obs_df.param == "HEIGHTCM", "weight"] = np.NaN
-    heights = obs_df[obs_df.param == "HEIGHTCM"]
-    weights = obs_df[obs_df.param == "WEIGHTKG"]
-    merged = heights.merge(
-        weights, on=["subjid", "agedays", "ageyears", "sex"], how="outer"
-    )
-    only_needed_columns = merged.drop(
-        columns=[
-            "param_x",
-            "measurement_x",
-            "clean_value_x",
-            "weight_x",
-            "id_y",
-            "param_y",
-            "measurement_y",
-            "clean_value_y",
-            "height_y",
-        ]
+    keys = ["subjid", "agedays", "sex"]
+    heights = obs_df.loc[
+        obs_df.param == "HEIGHTCM",
+        [
+            "id",
+            "subjid",
+            "agedays",
+            "ageyears",
+            "sex",
+            "clean_cat",
+            "include",
+            "measurement",
+        ],
+    ]
+    heights.rename(
+        columns={
+            "clean_cat": "height_cat",
+            "include": "include_height",
+            "measurement": "height",
+        },
+        inplace=True,
     )
-    clean_column_names = only_needed_columns.rename(
+    weights = obs_df.loc[
+        obs_df.param == "WEIGHTKG",
+        keys + ["ageyears", "clean_cat", "include", "measurement"],
+    ]
+    weights.rename(
         columns={
-            "clean_cat_x": "height_cat",
-            "include_x": "include_height",
-            "height_x": "height",
-            "clean_cat_y": "weight_cat",
-            "include_y": "include_weight",
-            "weight_y": "weight",
-            "reason_y": "reason",
-            "id_x": "id",
-        }
+            "ageyears": "weight_ageyears",
+            "clean_cat": "weight_cat",
+            "include": "include_weight",
+            "measurement": "weight",
+        },
+        inplace=True,
     )
-    clean_column_names["bmi"] = clean_column_names["weight"] / (
-        (clean_column_names["height"] / 100) ** 2
+    clean_column_names = heights.merge(weights, on=keys, how="outer")
+    clean_column_names["ageyears"] = clean_column_names["ageyears"].fillna(
+        clean_column_names.pop("weight_ageyears")
     )
-    clean_column_names["rounded_age"] = np.around(clean_column_names.ageyears)
-    clean_column_names["include_both"] = (
-        clean_column_names["include_height"] & clean_column_names["include_weight"]
+    height = clean_column_names["height"].to_numpy()
+    weight = clean_column_names["weight"].to_numpy()
+    # Missing include flags (only one param measured) count as not included
+    include_height = clean_column_names["include_height"].eq(True).to_numpy()
+    include_weight = clean_column_names["include_weight"].eq(True).to_numpy()
+    clean_column_names["bmi"] = _bmi(weight, height)
+    # Stays float so missing ages remain NaN
+    clean_column_names["rounded_age"] = np.rint(
+        clean_column_names["ageyears"].to_numpy()
     )
+    clean_column_names["include_both"] = include_height & include_weight
     return clean_column_names
 
 
@@ -317,12 +355,9 @@ def exclusion_information(obs):
     Returns:
     A DataFrame with the counts and percentages
     """
-    exc = (
-        obs.groupby(["param", "clean_cat"])
-        .agg({"id": "count"})
-        .reset_index()
-        .pivot(index="clean_cat", columns="param", values="id")
-    )
+    # Only heights and weights are reported
+    obs = obs.loc[obs["param"].isin(["HEIGHTCM", "WEIGHTKG"]), ["param", "clean_cat"]]
+    exc = pd.crosstab(obs["clean_cat"], obs["param"])
     exc["height percent"] = exc["HEIGHTCM"] / exc["HEIGHTCM"].sum() * 100
     exc["weight percent"] = exc["WEIGHTKG"] / exc["WEIGHTKG"].sum() * 100
     exc = exc.fillna(0)
@@ -339,25 +374,6 @@ def exclusion_information(obs):
     )
 
 
-def label_incl(row):
-    """
-    Categorizes BMI calculations as Include, Implausible, or unable to calculate (Only
-    Wt or Ht)
-
-    Parameters:
-    row: (Series) dataframe row
-
-    Returns:
-    Category (str) for BMI calculation
-    """
-    if row["include_both"] is True:
-        return "Include"
-    elif (row["weight_cat"] == "Implausible") | (row["height_cat"] == "Implausible"):
-        return "Implausible"
-    else:
-        return "Only Wt or Ht"
-
-
 def setup_bmi_adults(merged_df, obs):
     """
     Appends BMI data onto adults weight and height observations
@@ -384,12 +400,20 @@ def setup_bmi_adults(merged_df, obs):
             "include_both",
         ]
     ]
-    incl_col = data.apply(lambda row: label_incl(row), axis=1)
-    data = data.assign(clean_cat=incl_col.values)
-    data["param"] = "BMI"
-    data["clean_value"] = data["clean_cat"]
-    data.rename(columns={"bmi": "measurement"}, inplace=True)
-    return pd.concat([obs, data])
+    # Categorize each BMI as Include, Implausible, or Only Wt or Ht
+    implausible = _category_mask(data["weight_cat"], ["Implausible"]) | _category_mask(
+        data["height_cat"], ["Implausible"]
+    )
+    incl_col = np.select(
+        [data["include_both"].to_numpy(dtype=bool), implausible],
+        ["Include", "Implausible"],
+        default="Only Wt or Ht",
+    )
+    data = data.assign(clean_cat=incl_col, param="BMI", clean_value=incl_col).rename(
+        columns={"bmi": "measurement"}
+    )
+    data = data.reindex(columns=obs.columns.union(data.columns, sort=False))
+    return pd.concat([obs, data], ignore_index=True)
 
 
 def data_frame_names(da_locals):
@@ -402,15 +426,14 @@ def data_frame_names(da_locals):
     Returns:
     list of the dataframe names
     """
-    frames = []
-    for key, value in da_locals.items():
-        if isinstance(value, pd.DataFrame):
-            if key.startswith("_") is False:
-                frames.append(key)
-    return frames
+    return [
+        key
+        for key, value in da_locals.items()
+        if not key.startswith("_") and isinstance(value, pd.DataFrame)
+    ]
 
 
-def export_to_csv(da_locals, selection_widget, out):
+def export_to_csv(da_locals, selection_widget, out, use_pyarrow=False):
     """
     Saves out csv file of dataframe
 
@@ -418,14 +441,122 @@ def export_to_csv(da_locals, selection_widget, out):
     da_locals: (dict) all the local variables
     selection_widget: (Widget) interactive object used
     out: (Widgets.Outputs) output from widget
+    use_pyarrow: (bool) write with pyarrow's multithreaded CSV writer when it is
+        installed, which is much faster on large DataFrames. Its output reads back
+        with pd.read_csv to the same values, but differs in format from to_csv: the
+        header and string values are quoted, booleans are written as true/false and
+        whole number floats are written without a trailing ".0"
 
     """
     df_name = selection_widget.value
-    da_locals[df_name].to_csv("output/{}.csv".format(df_name), index=False)
+    _write_csv(da_locals[df_name], "output/{}.csv".format(df_name), use_pyarrow)
     out.clear_output()
     out.append_display_data(FileLinks("output"))
 
 
+def _write_csv(df, path, use_pyarrow):
+    """
+    Writes a DataFrame to a CSV file without its index
+
+    Parameters:
+    df: (DataFrame) to write
+    path: (str) path of the CSV file
+    use_pyarrow: (bool) write with pyarrow when it is installed
+    """
+    if use_pyarrow and pa is not None:
+        # Not every column pandas can hold converts to Arrow
+        try:
+            pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+            return
+        except pa.ArrowException:
+            pass
+    df.to_csv(path, index=False)
+
+
+def _bmi(weight, height):
+    """
+    Calculates BMI from weights and heights
+
+    Parameters:
+    weight: (ndarray) weights in kilograms
+    height: (ndarray) heights in centimeters
+
+    Returns:
+    Array of BMI values
+    """
+    return weight * 10000.0 / (height * height)
+
+
+def _category_mask(cat_series, labels):
+    """
+    Builds a boolean mask of the rows in a categorical Series that hold any of the
+    given labels
+
+    Parameters:
+    cat_series: (Series) with a categorical dtype
+    labels: (list) category labels to match; labels that are not categories of
+        cat_series never match
+
+    Returns:
+    Boolean numpy array the same length as cat_series
+    """
+    categories = cat_series.cat.categories
+    codes = [categories.get_loc(label) for label in labels if label in categories]
+    return np.isin(cat_series.cat.codes.to_numpy(), codes)
+
+
+def _relabel_categories(cat_series, conditions, labels, new_categories=()):
+    """
+    Sets the rows of a categorical Series that match each condition to the
+    corresponding label
+
+    Parameters:
+    cat_series: (Series) with a categorical dtype
+    conditions: (list) boolean arrays the same length as cat_series
+    labels: (list) category label to set for each condition
+    new_categories: (list) categories to append to those of cat_series; labels must
+        be in one or the other
+
+    Returns:
+    Categorical Series with the same index as cat_series, and its categories
+        followed by new_categories
+    """
+    dtype = pd.CategoricalDtype(
+        cat_series.cat.categories.append(pd.Index(new_categories)),
+        ordered=cat_series.cat.ordered,
+    )
+    codes = np.select(
+        conditions,
+        [dtype.categories.get_loc(label) for label in labels],
+        default=cat_series.cat.codes.to_numpy(),
+    )
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype=dtype),
+        index=cat_series.index,
+    )
+
+
+def _category_factors(cat_series, factors):
+    """
+    Looks up a numeric factor for every row of a categorical Series
+
+    Parameters:
+    cat_series: (Series) with a categorical dtype
+    factors: (dict) mapping category labels to factors; every other category, and
+        missing values, get a factor of 1
+
+    Returns:
+    Float numpy array the same length as cat_series
+    """
+    categories = cat_series.cat.categories
+    # The extra last entry is for the -1 code of missing values
+    table = np.ones(len(categories) + 1)
+    for label, factor in factors.items():
+        if label in categories:
+            table[categories.get_loc(label)] = factor
+    return table[cat_series.cat.codes.to_numpy()]
+
+
 def clean_swapped_values(merged_df):
     """
     This function will look in a DataFrame for rows where the height_cat and weight_cat
@@ -443,32 +574,39 @@ def clean_swapped_values(merged_df):
     Returns:
     The cleaned DataFrame
     """
-    merged_df["postprocess_height_cat"] = merged_df["height_cat"]
-    merged_df["postprocess_height_cat"] = merged_df[
-        "postprocess_height_cat"
-    ].cat.add_categories(["Include-Fixed-Swap"])
-    merged_df["postprocess_weight_cat"] = merged_df["weight_cat"]
-    merged_df["postprocess_weight_cat"] = merged_df[
-        "postprocess_weight_cat"
-    ].cat.add_categories(["Include-Fixed-Swap"])
-
     # Allow for both pediatric and adult exclusion forms
     exclusions = ["Swapped-Measurements", "Exclude-Adult-Swapped-Measurements"]
     # Condition: both must be flagged as swaps
-    cond = merged_df["height_cat"].isin(exclusions) & merged_df["weight_cat"].isin(
-        exclusions
+    cond = _category_mask(merged_df["height_cat"], exclusions) & _category_mask(
+        merged_df["weight_cat"], exclusions
     )
 
-    # Swap height and weight
-    merged_df.loc[cond, ["height", "weight"]] = merged_df.loc[
-        cond, ["weight", "height"]
-    ].values
-
     # Record that they were swapped
-    merged_df.loc[cond, "postprocess_height_cat"] = "Include-Fixed-Swap"
-    merged_df.loc[cond, "postprocess_weight_cat"] = "Include-Fixed-Swap"
+    merged_df["postprocess_height_cat"] = _relabel_categories(
+        merged_df["height_cat"],
+        [cond],
+        ["Include-Fixed-Swap"],
+        new_categories=["Include-Fixed-Swap"],
+    )
+    merged_df["postprocess_weight_cat"] = _relabel_categories(
+        merged_df["weight_cat"],
+        [cond],
+        ["Include-Fixed-Swap"],
+        new_categories=["Include-Fixed-Swap"],
+    )
 
-    merged_df["bmi"] = merged_df["weight"] / ((merged_df["height"] / 100) ** 2)
+    # Swap height and weight
+    swapped = np.flatnonzero(cond)
+    if swapped.size:
+        height = merged_df["height"].to_numpy(copy=True)
+        weight = merged_df["weight"].to_numpy(copy=True)
+        height[swapped], weight[swapped] = weight[swapped], height[swapped]
+        merged_df["height"] = height
+        merged_df["weight"] = weight
+
+    merged_df["bmi"] = _bmi(
+        merged_df["weight"].to_numpy(), merged_df["height"].to_numpy()
+    )
     return merged_df
 
 
@@ -493,37 +631,36 @@ def clean_unit_errors(merged_df):
     Returns:
     The cleaned DataFrame
     """
-    merged_df["postprocess_height_cat"] = merged_df["height_cat"]
-    merged_df["postprocess_height_cat"] = merged_df[
-        "postprocess_height_cat"
-    ].cat.add_categories(["Include-UH", "Include-UL"])
-    merged_df["postprocess_weight_cat"] = merged_df["weight_cat"]
-    merged_df["postprocess_weight_cat"] = merged_df[
-        "postprocess_weight_cat"
-    ].cat.add_categories(["Include-UH", "Include-UL"])
-    merged_df.loc[merged_df["height_cat"] == "Unit-Error-Low", "height"] = (
-        merged_df.loc[merged_df["height_cat"] == "Unit-Error-Low", "height"] * 2.54
+    height_low = _category_mask(merged_df["height_cat"], ["Unit-Error-Low"])
+    height_high = _category_mask(merged_df["height_cat"], ["Unit-Error-High"])
+    weight_low = _category_mask(merged_df["weight_cat"], ["Unit-Error-Low"])
+    weight_high = _category_mask(merged_df["weight_cat"], ["Unit-Error-High"])
+    # Convert unit errors, dividing rather than multiplying for the high errors
+    height_cat = merged_df["height_cat"]
+    weight_cat = merged_df["weight_cat"]
+    merged_df["height"] = (
+        merged_df["height"].to_numpy()
+        * _category_factors(height_cat, {"Unit-Error-Low": 2.54})
+        / _category_factors(height_cat, {"Unit-Error-High": 2.54})
+    )
+    merged_df["weight"] = (
+        merged_df["weight"].to_numpy()
+        * _category_factors(weight_cat, {"Unit-Error-Low": 2.2046})
+        / _category_factors(weight_cat, {"Unit-Error-High": 2.2046})
     )
-    merged_df.loc[merged_df["height_cat"] == "Unit-Error-High", "height"] = (
-        merged_df.loc[merged_df["height_cat"] == "Unit-Error-High", "height"] / 2.54
+    merged_df["postprocess_height_cat"] = _relabel_categories(
+        merged_df["height_cat"],
+        [height_low, height_high],
+        ["Include-UL", "Include-UH"],
+        new_categories=["Include-UH", "Include-UL"],
     )
-    merged_df.loc[merged_df["weight_cat"] == "Unit-Error-Low", "weight"] = (
-        merged_df.loc[merged_df["weight_cat"] == "Unit-Error-Low", "weight"] * 2.2046
+    merged_df["postprocess_weight_cat"] = _relabel_categories(
+        merged_df["weight_cat"],
+        [weight_low, weight_high],
+        ["Include-UL", "Include-UH"],
+        new_categories=["Include-UH", "Include-UL"],
     )
-    merged_df.loc[merged_df["weight_cat"] == "Unit-Error-High", "weight"] = (
-        merged_df.loc[merged_df["weight_cat"] == "Unit-Error-High", "weight"] / 2.2046
+    merged_df["bmi"] = _bmi(
+        merged_df["weight"].to_numpy(), merged_df["height"].to_numpy()
     )
-    merged_df.loc[
-        merged_df["height_cat"] == "Unit-Error-Low", "postprocess_height_cat"
-    ] = "Include-UL"
-    merged_df.loc[
-        merged_df["height_cat"] == "Unit-Error-High", "postprocess_height_cat"
-    ] = "Include-UH"
-    merged_df.loc[
-        merged_df["weight_cat"] == "Unit-Error-Low", "postprocess_weight_cat"
-    ] = "Include-UL"
-    merged_df.loc[
-        merged_df["weight_cat"] == "Unit-Error-High", "postprocess_weight_cat"
-    ] = "Include-UH"
-    merged_df["bmi"] = merged_df["weight"] / ((merged_df["height"] / 100) ** 2)
     return merged_df
@@ -1,5 +1,6 @@
 import math
 import numpy as np
+import pandas as pd
 from IPython.display import Markdown
 
 
@@ -14,27 +15,24 @@ def setup_percentile_zscore_adults(percentiles_clean):
     Dataframe with mean/sd values
     """
     dta_forz_long = percentiles_clean[["Mean", "Sex", "param", "age", "sd"]]
-
-    def label_param(row):
-        if row["param"] == "WEIGHTKG":
-            return "weight"
-        if row["param"] == "BMI":
-            return "bmi"
-        if row["param"] == "HEIGHTCM":
-            return "height"
-
-    param_col = dta_forz_long.apply(lambda row: label_param(row), axis=1)
-    dta_forz_long = dta_forz_long.assign(param2=param_col.values)
+    param_col = (
+        dta_forz_long["param"]
+        .astype("category")
+        .map({"WEIGHTKG": "weight", "BMI": "bmi", "HEIGHTCM": "height"})
+    )
+    dta_forz_long = dta_forz_long.assign(param2=param_col)
     # preserving some capitalization to maintain compatibility with pediatric
     # percentiles data
-    dta_forz = dta_forz_long.pivot_table(
-        index=["Sex", "age"], columns="param2", values=["Mean", "sd"], aggfunc="first"
+    dta_forz = (
+        dta_forz_long.set_index(["Sex", "age", "param2"])[["Mean", "sd"]]
+        .unstack("param2")
+        .sort_index(axis=1, level=1)
     )
-    dta_forz = dta_forz.sort_index(axis=1, level=1)
     dta_forz.columns = [f"{x}_{y}" for x, y in dta_forz.columns]
     dta_forz = dta_forz.reset_index()
     dta_forz["rounded_age"] = dta_forz["age"]
     dta_forz.rename(columns={"Sex": "sex"}, inplace=True)
+    dta_forz["sex"] = dta_forz["sex"].astype("int8")
     return dta_forz
 
 
@@ -50,7 +48,13 @@ def add_mzscored_to_merged_df_adults(merged_df, pctls):
     Returns:
     merged Dataframe
     """
-    pct_df = pctls.drop(columns={"age"})
+    # Match the key dtypes of the observations
+    pct_df = pctls.drop(columns={"age"}).astype(
+        {
+            "sex": merged_df["sex"].dtype,
+            "rounded_age": merged_df["rounded_age"].dtype,
+        }
+    )
     merged_df = merged_df.merge(pct_df, on=["sex", "rounded_age"], how="left")
     return merged_df
 
@@ -59,7 +63,8 @@ def add_mzscored_to_merged_df_pediatrics(
     merged_df, wt_percentiles, ht_percentiles, bmi_percentiles
 ):
     """
-    Merges mean/sd values onto pediatrics data for z-score calculations
+    Merges mean/sd values onto pediatrics data for z-score calculations. Each
+    percentiles table may already be prepared with prepare_pediatric_percentiles.
 
     Parameters:
     merged_df: (DataFrame) with subjid, bmi, include_height, include_weight, rounded_age
@@ -71,16 +76,36 @@ def add_mzscored_to_merged_df_pediatrics(
     Returns:
     merged Dataframe
     """
-
-    merged_df = calculate_modified_zscore_pediatrics(
-        merged_df, wt_percentiles, "weight"
-    )
-    merged_df = calculate_modified_zscore_pediatrics(
-        merged_df, ht_percentiles, "height"
+    agemos, halfmos = _half_month_keys(merged_df["ageyears"].to_numpy())
+    z_scores = _modified_zscores_pediatrics(
+        merged_df,
+        halfmos,
+        {"weight": wt_percentiles, "height": ht_percentiles, "bmi": bmi_percentiles},
     )
-    merged_df = calculate_modified_zscore_pediatrics(merged_df, bmi_percentiles, "bmi")
+    return merged_df.assign(agemos=agemos, **z_scores)
 
-    return merged_df
+
+def prepare_pediatric_percentiles(percentiles):
+    """
+    Adds the scale used by the modified Z score to a pediatrics percentiles table
+
+    Parameters:
+    percentiles: (DataFrame) CDC growth chart DataFrame with L, M, S values
+
+    Returns:
+    The percentiles with a half_of_two_z_scores column added
+    """
+    lms_l = percentiles["L"].to_numpy()
+    lms_m = percentiles["M"].to_numpy()
+    lms_s = percentiles["S"].to_numpy()
+    # M * ((1 + 2LS) ** (1 / L) - 1)
+    half_of_two_z_scores = lms_l * lms_s
+    half_of_two_z_scores *= 2
+    half_of_two_z_scores += 1
+    np.power(half_of_two_z_scores, 1 / lms_l, out=half_of_two_z_scores)
+    half_of_two_z_scores -= 1
+    half_of_two_z_scores *= lms_m
+    return percentiles.assign(half_of_two_z_scores=half_of_two_z_scores)
 
 
 def add_smoothed_zscore_to_merged_df_pediatrics(df_merged, df_percentiles):
@@ -132,60 +157,72 @@ def bmi_stats(
     If out is None, it will return a DataFrame. If out is provided, results will be
         displayed in the notebook.
     """
-    # Incoming data is float, not int
-    merged_df["rounded_age"] = merged_df["rounded_age"].astype(int)
+    stat_columns = {
+        func: column
+        for func, column, include in (
+            ("min", "min", include_min),
+            ("mean", "mean", include_mean),
+            ("max", "max", include_max),
+            ("std", "sd", include_std),
+            ("count", "count", include_count),
+        )
+        if include
+    }
+    formatters = {
+        f"{column}_{suffix}": "{:.2f}".format
+        for func, column in stat_columns.items()
+        if func != "count"
+        for suffix in ("clean", "raw")
+    }
+    if not stat_columns:
+        if out is None:
+            return pd.DataFrame()
+        out.outputs = ()
+        return
 
-    if include_missing:
-        age_filtered = merged_df[
-            (merged_df.rounded_age >= age_range[0])
-            & (merged_df.rounded_age <= age_range[1])
-        ]
-    else:
-        age_filtered = merged_df[
-            (merged_df.rounded_age >= age_range[0])
-            & (merged_df.rounded_age <= age_range[1])
-            & (merged_df.weight > 0)
-            & (merged_df.height > 0)
-        ]
-    age_filtered["sex"] = age_filtered.sex.replace(0, "M").replace(1, "F")
-    agg_functions = []
-    formatters = {}
-
-    if include_min:
-        agg_functions.append("min")
-        formatters["min_clean"] = "{:.2f}".format
-        formatters["min_raw"] = "{:.2f}".format
-    if include_mean:
-        agg_functions.append("mean")
-        formatters["mean_clean"] = "{:.2f}".format
-        formatters["mean_raw"] = "{:.2f}".format
-    if include_max:
-        agg_functions.append("max")
-        formatters["max_clean"] = "{:.2f}".format
-        formatters["max_raw"] = "{:.2f}".format
-    if include_std:
-        agg_functions.append("std")
-        formatters["sd_clean"] = "{:.2f}".format
-        formatters["sd_raw"] = "{:.2f}".format
-    if include_count:
-        agg_functions.append("count")
-    clean_groups = (
-        age_filtered[age_filtered.include_both]
-        .groupby(["sex", "rounded_age"])["bmi"]
-        .agg(agg_functions)
-    )
-    raw_groups = age_filtered.groupby(["sex", "rounded_age"])["bmi"].agg(agg_functions)
-    merged_stats = clean_groups.merge(
-        raw_groups, on=["sex", "rounded_age"], suffixes=("_clean", "_raw")
+    rounded_age = merged_df["rounded_age"].to_numpy()
+    mask = (rounded_age >= age_range[0]) & (rounded_age <= age_range[1])
+    if not include_missing:
+        mask &= (merged_df["weight"].to_numpy() > 0) & (
+            merged_df["height"].to_numpy() > 0
+        )
+    # Incoming data is float, not int
+    age_filtered = merged_df.loc[
+        mask, ["sex", "rounded_age", "bmi", "include_both"]
+    ].astype({"sex": "int8", "rounded_age": "int16"})
+    # Clean BMIs are those where both height and weight are included
+    included = age_filtered["include_both"].to_numpy(dtype=bool)
+    grouped = age_filtered.assign(
+        bmi_clean=np.where(included, age_filtered["bmi"].to_numpy(), np.nan)
+    ).groupby(["sex", "rounded_age"])
+    aggregations = [func for func in stat_columns if func != "count"]
+    if aggregations:
+        all_stats = grouped[["bmi_clean", "bmi"]].agg(aggregations)
+    # Included rows always have a BMI, as do all rows once missing values are dropped
+    included_counts = grouped["include_both"].sum()
+    counts = {
+        "bmi_clean": included_counts,
+        "bmi": grouped["bmi"].count() if include_missing else grouped.size(),
+    }
+    suffixes = {"bmi_clean": "clean", "bmi": "raw"}
+    merged_stats = pd.DataFrame(
+        {
+            f"{stat_columns[func]}_{suffixes[column]}": (
+                counts[column] if func == "count" else all_stats[(column, func)]
+            )
+            for column in suffixes
+            for func in stat_columns
+        }
     )
+    # Leave out groups without any included BMI
+    merged_stats = merged_stats[included_counts.to_numpy() > 0]
+    merged_stats = merged_stats.rename(
+        index={0: "M", 1: "F"}, level="sex"
+    ).sort_index()
     if include_mean & include_count & include_mean_diff:
         merged_stats["count_diff"] = (
             merged_stats["count_raw"] - merged_stats["count_clean"]
         )
-    if include_std:
-        merged_stats = merged_stats.rename(
-            columns={"std_raw": "sd_raw", "std_clean": "sd_clean"}
-        )
     if out is None:
         return merged_stats
     else:
@@ -207,31 +244,167 @@ def calculate_modified_zscore_pediatrics(merged_df, percentiles, category):
     Parameters:
     merged_df: (DataFrame) with subjid, sex, weight and age columns
     percentiles: (DataFrame) CDC growth chart DataFrame with L, M, S values for the
-        desired category
+        desired category, optionally prepared with prepare_pediatric_percentiles
     category: (str) name of category
 
     Returns
     The dataframe with a new zscore column mapped with the z_column_name list
     """
-    pct_cpy = percentiles.copy()
-    pct_cpy["half_of_two_z_scores"] = (
-        pct_cpy["M"]
-        * np.power((1 + pct_cpy["L"] * pct_cpy["S"] * 2), (1 / pct_cpy["L"]))
-    ) - pct_cpy["M"]
+    _, halfmos = _half_month_keys(merged_df["ageyears"].to_numpy())
+    return merged_df.assign(
+        **_modified_zscores_pediatrics(merged_df, halfmos, {category: percentiles})
+    )
+
+
+def _modified_zscores_pediatrics(merged_df, halfmos, percentiles):
+    """
+    Computes modified Z scores for each measurement type that has percentiles
+
+    Parameters:
+    merged_df: (DataFrame) with sex and measurement columns
+    halfmos: (ndarray) growth chart age in half months for each observation, as
+        returned by _half_month_keys
+    percentiles: (dict) CDC growth chart DataFrame with L, M, S values for each
+        category name
+
+    Returns:
+    Dictionary of z score column names to arrays of modified Z scores
+    """
+    z_column_name = {"weight": "wtz", "height": "htz", "bmi": "bmiz"}
+    dense = [_dense_chart(pct) for pct in percentiles.values()]
+    # Pad each chart to a common shape so all categories share a single lookup
+    charts = np.full(
+        (len(dense), 2) + tuple(np.max([c.shape[1:] for c in dense], axis=0)), np.nan
+    )
+    for chart, values in zip(charts, dense):
+        chart[:, : values.shape[1], : values.shape[2]] = values
+    lookup = _gather_chart_values(charts, merged_df["sex"].to_numpy(), halfmos)
+    return {
+        z_column_name[category]: _modified_zscore(
+            merged_df[category].to_numpy(), lms_m, half_of_two_z_scores
+        )
+        for category, (lms_m, half_of_two_z_scores) in zip(percentiles, lookup)
+    }
+
+
+def _dense_chart(percentiles):
+    """
+    Lays out growth chart M and half_of_two_z_scores values in a dense array indexed
+    by sex code and age in half months, with NaN for ages not on the chart
+
+    Parameters:
+    percentiles: (DataFrame) CDC growth chart DataFrame with L, M, S values, optionally
+        prepared with prepare_pediatric_percentiles
+
+    Returns:
+    ndarray of shape (2, number of sexes, number of half months)
+    """
+    if "half_of_two_z_scores" not in percentiles.columns:
+        percentiles = prepare_pediatric_percentiles(percentiles)
+    sex = percentiles["Sex"].to_numpy(dtype=np.int64)
+    halfmos = (percentiles["Agemos"].to_numpy() * 2).astype(np.int64)
+    chart = np.full((2, sex.max() + 1, halfmos.max() + 1), np.nan)
+    chart[0, sex, halfmos] = percentiles["M"].to_numpy()
+    chart[1, sex, halfmos] = percentiles["half_of_two_z_scores"].to_numpy()
+    return chart
+
+
+def _gather_chart_values(chart, sex, halfmos):
+    """
+    Looks up dense growth chart values for each observation, returning NaN where the
+    sex code or age falls outside of the chart
+
+    Parameters:
+    chart: (ndarray) chart values with sex code and age in half months as the last two
+        axes, as built by _dense_chart
+    sex: (ndarray) sex code for each observation
+    halfmos: (ndarray) age in half months for each observation, as returned by
+        _half_month_keys
+
+    Returns:
+    ndarray with the leading axes of chart and one value per observation
+    """
+    n_sex, n_halfmos = chart.shape[-2:]
+    sex = np.asarray(sex, dtype=np.int64)
+    on_chart = (sex >= 0) & (sex < n_sex) & (halfmos >= 0) & (halfmos < n_halfmos)
+    values = chart[..., np.where(on_chart, sex, 0), np.where(on_chart, halfmos, 0)]
+    values[..., ~on_chart] = np.nan
+    return values
+
+
+def _half_month_keys(ageyears):
+    """
+    Calculates the growth chart age in months for each observation, along with the
+    whole number of half months used to look up chart values
+
+    Parameters:
+    ageyears: (ndarray) age in years for each observation
+
+    Returns:
+    Tuple of (agemos, halfmos) arrays, with halfmos set to -1 where the age is missing
+    """
     # Calculate an age in months by rounding and then adding 0.5 to have values that
     # match the growth chart
-    merged_df["agemos"] = np.around(merged_df["ageyears"] * 12) + 0.5
-    mswpt = merged_df.merge(
-        pct_cpy[["Agemos", "M", "Sex", "half_of_two_z_scores"]],
-        how="left",
-        left_on=["sex", "agemos"],
-        right_on=["Sex", "Agemos"],
+    agemos = np.around(ageyears * 12) + 0.5
+    finite = np.isfinite(agemos)
+    halfmos = np.full(agemos.shape, -1, dtype=np.int64)
+    halfmos[finite] = (agemos[finite] * 2).astype(np.int64)
+    return agemos, halfmos
+
+
+def _modified_zscore(values, lms_m, half_of_two_z_scores):
+    """
+    Computes modified z scores from plain arrays
+
+    Parameters:
+    values: (ndarray) observed measurements
+    lms_m: (ndarray) CDC M values for each observation
+    half_of_two_z_scores: (ndarray) modified z score scale for each observation
+
+    Returns:
+    Array of modified z scores
+    """
+    z_scores = np.subtract(values, lms_m, dtype=float)
+    z_scores /= half_of_two_z_scores
+    return z_scores
+
+
+def _smoothed_zscores(
+    values, lms_l, lms_m, lms_s, csd_pos, csd_neg, ages, who_weight, cdc_weight
+):
+    """
+    Computes CDC, WHO and smoothed z scores for one measurement type from plain
+    arrays
+
+    Parameters:
+    values: (ndarray) observed measurements
+    lms_l, lms_m, lms_s: (ndarray) CDC L, M and S values for each observation
+    csd_pos, csd_neg: (ndarray) CDC csd values above and below the median
+    ages: (ndarray) age in years for each observation
+    who_weight, cdc_weight: (ndarray) weighting values for smoothing between 2-4
+
+    Returns:
+    Tuple of (CDC, WHO, smoothed) z score arrays
+    """
+    # Silence warnings from the branches np.where and np.select discard
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cdc_z = np.where(
+            lms_l != 0,
+            (((values / lms_m) ** lms_l) - 1) / (lms_l * lms_s),
+            np.log(values / lms_m) / lms_s,
+        )
+        who_z = np.select(
+            [values == lms_m, values > lms_m, values < lms_m],
+            [0, (values - lms_m) / (csd_pos / 2), (values - lms_m) / (csd_neg / 2)],
+            default=np.nan,
+        )
+    # Smooth between 2-4
+    s_z = np.select(
+        [ages <= 2, (ages > 2) & (ages < 4), ages >= 4],
+        [who_z, ((who_z * who_weight) + (cdc_z * cdc_weight)) / 2, cdc_z],
+        default=np.nan,
     )
-    z_column_name = {"weight": "wtz", "height": "htz", "bmi": "bmiz"}
-    mswpt[z_column_name[category]] = (mswpt[category] - mswpt["M"]) / mswpt[
-        "half_of_two_z_scores"
-    ]
-    return mswpt.drop(columns=["Agemos", "Sex", "M", "half_of_two_z_scores"])
+    return cdc_z, who_z, s_z
 
 
 def calculate_smoothed_zscore_pediatrics(df_merged, df_percentiles):
@@ -246,50 +419,33 @@ def calculate_smoothed_zscore_pediatrics(df_merged, df_percentiles):
     Returns:
     DataFrame with smoothed zscore column for each measurement type
     """
-    df_pct = df_percentiles.copy()
-
     # Merge z scores into observations
     df = df_merged.merge(
-        df_pct,
+        df_percentiles,
         how="left",
         left_on=["agedays", "ageyears", "sex"],
         right_on=["agedays", "age", "Sex"],
     )
 
+    ages = df["ageyears"].to_numpy()
+    who_weight = df["whoweight"].to_numpy()
+    cdc_weight = df["cdcweight"].to_numpy()
+    z_columns = []
+    z_values = []
     for p, param in (("ht", "height"), ("wt", "weight"), ("bmi", "bmi")):
-        cdc_l_var = f"cdc_{p}_l"
-        cdc_m_var = f"cdc_{p}_m"
-        cdc_s_var = f"cdc_{p}_s"
-        cdc_csd_pos_var = f"cdc_{p}_csd_pos"
-        cdc_csd_neg_var = f"cdc_{p}_csd_neg"
-        cdc_z_var = f"cdc_{p}_z"
-        who_z_var = f"who_{p}_z"
-        s_z_var = f"{p}z"
-
-        # Assign CDC z scores
-        df[cdc_z_var] = np.where(
-            df[cdc_l_var] != 0,
-            (
-                (((df[param] / df[cdc_m_var]) ** df[cdc_l_var]) - 1)
-                / (df[cdc_l_var] * df[cdc_s_var])
-            ),
-            (np.log(df[param] / df[cdc_m_var]) / df[cdc_s_var]),
-        )
-
-        # Assign WHO z scores
-        df.loc[df[param] == df[cdc_m_var], who_z_var] = 0
-        df.loc[df[param] > df[cdc_m_var], who_z_var] = (df[param] - df[cdc_m_var]) / (
-            df[cdc_csd_pos_var] / 2
+        cdc_z, who_z, s_z = _smoothed_zscores(
+            df[param].to_numpy(),
+            df[f"cdc_{p}_l"].to_numpy(),
+            df[f"cdc_{p}_m"].to_numpy(),
+            df[f"cdc_{p}_s"].to_numpy(),
+            df[f"cdc_{p}_csd_pos"].to_numpy(),
+            df[f"cdc_{p}_csd_neg"].to_numpy(),
+            ages,
+            who_weight,
+            cdc_weight,
         )
-        df.loc[df[param] < df[cdc_m_var], who_z_var] = (df[param] - df[cdc_m_var]) / (
-            df[cdc_csd_neg_var] / 2
-        )
-
-        # Assign z scores, smoothing between 2-4
-        df.loc[df["ageyears"] <= 2, s_z_var] = df[who_z_var]
-        df.loc[df["ageyears"].between(2, 4, inclusive="neither"), s_z_var] = (
-            (df[who_z_var] * df["whoweight"]) + (df[cdc_z_var] * df["cdcweight"])
-        ) / 2
-        df.loc[df["ageyears"] >= 4, s_z_var] = df[cdc_z_var]
+        z_columns += [f"cdc_{p}_z", f"who_{p}_z", f"{p}z"]
+        z_values += [cdc_z, who_z, s_z]
+    df[z_columns] = np.column_stack(z_values)
 
     return df
@@ -1,5 +1,6 @@
 import unittest
 
+import numpy as np
 import pandas as pd
 
 from growthviz import processdata
@@ -118,3 +119,67 @@ class PctPedBMITestCase(unittest.TestCase):
         df_ht, df_wt, _ = processdata.split_percentiles_pediatrics(df_percentiles)
         self.assertTrue(df_ht["age"].between(0, 21.1, inclusive="both").all())
         self.assertTrue(df_wt["age"].between(0, 21.1, inclusive="both").all())
+
+
+class PostprocessTestCase(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv("growthviz-data/sample-data-cleaned-with-ue.csv")
+        obs = processdata.setup_individual_obs_df(df)
+        self.merge_df = processdata.setup_merged_df(obs)
+
+    def test_clean_unit_errors(self):
+        cleaned = processdata.clean_unit_errors(self.merge_df.copy())
+        unit_errors = 0
+        for param, factor in [("height", 2.54), ("weight", 2.2046)]:
+            cat = self.merge_df[f"{param}_cat"].astype(str)
+            low = (cat == "Unit-Error-Low").to_numpy()
+            high = (cat == "Unit-Error-High").to_numpy()
+            other = ~(low | high)
+            unit_errors += low.sum() + high.sum()
+            original = self.merge_df[param].to_numpy()
+            converted = cleaned[param].to_numpy()
+            self.assertTrue(np.allclose(converted[low], original[low] * factor))
+            self.assertTrue(np.allclose(converted[high], original[high] / factor))
+            self.assertTrue(
+                np.array_equal(converted[other], original[other], equal_nan=True)
+            )
+            postprocess = cleaned[f"postprocess_{param}_cat"].astype(str)
+            self.assertTrue((postprocess[low] == "Include-UL").all())
+            self.assertTrue((postprocess[high] == "Include-UH").all())
+            self.assertTrue((postprocess[other] == cat[other]).all())
+        # Every one of the 30 unit error observations lands on at least one row
+        self.assertGreaterEqual(unit_errors, 30)
+        self.assertTrue(
+            np.allclose(
+                cleaned["bmi"],
+                cleaned["weight"] * 10000 / cleaned["height"] ** 2,
+                equal_nan=True,
+            )
+        )
+
+    def test_clean_swapped_values(self):
+        cleaned = processdata.clean_swapped_values(self.merge_df.copy())
+        swaps = ["Swapped-Measurements", "Exclude-Adult-Swapped-Measurements"]
+        swapped = (
+            self.merge_df["height_cat"].astype(str).isin(swaps)
+            & self.merge_df["weight_cat"].astype(str).isin(swaps)
+        ).to_numpy()
+        self.assertTrue(swapped.any())
+        for param, other_param in [("height", "weight"), ("weight", "height")]:
+            self.assertTrue(
+                np.array_equal(
+                    cleaned[param].to_numpy()[swapped],
+                    self.merge_df[other_param].to_numpy()[swapped],
+                )
+            )
+            self.assertTrue(
+                np.array_equal(
+                    cleaned[param].to_numpy()[~swapped],
+                    self.merge_df[param].to_numpy()[~swapped],
+                    equal_nan=True,
+                )
+            )
+            cat = self.merge_df[f"{param}_cat"].astype(str)
+            postprocess = cleaned[f"postprocess_{param}_cat"].astype(str)
+            self.assertTrue((postprocess[swapped] == "Include-Fixed-Swap").all())
+            self.assertTrue((postprocess[~swapped] == cat[~swapped]).all())
@@ -1,5 +1,6 @@
 import unittest
 
+import numpy as np
 import pandas as pd
 
 from growthviz import processdata
@@ -15,3 +16,115 @@ class StatAdultTestCase(unittest.TestCase):
         long_df = sumstats.setup_percentile_zscore_adults(setup_df)
         self.assertTrue(len(setup_df) > len(long_df))
         self.assertIn(18, long_df["age"].values)
+
+
+class BMIStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv("growthviz-data/sample-adults-data.csv")
+        obs = processdata.setup_individual_obs_df(df)
+        obs = processdata.keep_age_range(obs, "adults")
+        self.merge_df = processdata.setup_merged_df(obs)
+
+    def test_bmi_stats_columns(self):
+        stats_df = sumstats.bmi_stats(self.merge_df)
+        self.assertEqual(
+            [
+                "min_clean",
+                "mean_clean",
+                "max_clean",
+                "sd_clean",
+                "count_clean",
+                "min_raw",
+                "mean_raw",
+                "max_raw",
+                "sd_raw",
+                "count_raw",
+                "count_diff",
+            ],
+            list(stats_df.columns),
+        )
+        self.assertEqual(["F", "M"], list(stats_df.index.unique(level="sex")))
+
+    def test_bmi_stats_counts(self):
+        stats_df = sumstats.bmi_stats(self.merge_df)
+        df = self.merge_df
+        df = df[
+            df["rounded_age"].between(20, 65) & (df["weight"] > 0) & (df["height"] > 0)
+        ]
+        df = df.assign(sex=df["sex"].map({0: "M", 1: "F"}))
+        keys = ["sex", "rounded_age"]
+        raw_counts = df.groupby(keys)["bmi"].count()
+        clean_counts = df[df["include_both"]].groupby(keys)["bmi"].count()
+        for (sex, age), row in stats_df.iterrows():
+            self.assertEqual(raw_counts[(sex, age)], row["count_raw"])
+            self.assertEqual(clean_counts[(sex, age)], row["count_clean"])
+            self.assertEqual(row["count_raw"] - row["count_clean"], row["count_diff"])
+        self.assertEqual(clean_counts.sum(), stats_df["count_clean"].sum())
+
+    def test_bmi_stats_count_only(self):
+        stats_df = sumstats.bmi_stats(
+            self.merge_df,
+            include_min=False,
+            include_mean=False,
+            include_max=False,
+            include_std=False,
+        )
+        self.assertEqual(["count_clean", "count_raw"], list(stats_df.columns))
+
+    def test_bmi_stats_empty_selection(self):
+        stats_df = sumstats.bmi_stats(
+            self.merge_df,
+            include_min=False,
+            include_mean=False,
+            include_max=False,
+            include_std=False,
+            include_count=False,
+        )
+        self.assertTrue(stats_df.empty)
+
+
+class StatPediatricTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = processdata.setup_percentiles_pediatrics("wtage.csv")
+
+    def test_prepare_pediatric_percentiles(self):
+        raw_df = self.df.drop(columns=["half_of_two_z_scores"])
+        prepared_df = sumstats.prepare_pediatric_percentiles(raw_df)
+        self.assertNotIn("half_of_two_z_scores", raw_df.columns)
+        self.assertEqual(len(raw_df), len(prepared_df))
+        # The loader prepares the table once, so it matches preparing it again
+        np.testing.assert_allclose(
+            self.df["half_of_two_z_scores"], prepared_df["half_of_two_z_scores"]
+        )
+        # M * ((1 + 2LS) ** (1 / L) - 1), worked out by hand for the first male and
+        # female rows
+        for sex, agemos, expected in [
+            (0, 24, 3.13725699723366),
+            (0, 24.5, 3.1602173960128273),
+            (1, 24, 3.1750685405525267),
+        ]:
+            row = prepared_df[
+                (prepared_df["Sex"] == sex) & (prepared_df["Agemos"] == agemos)
+            ]
+            self.assertAlmostEqual(expected, row["half_of_two_z_scores"].iloc[0])
+
+    def test_calculate_modified_zscore_pediatrics(self):
+        merged_df = pd.DataFrame(
+            {
+                "sex": [0, 0, 1, 0],
+                "ageyears": [2.0, 25.0, 1.0, np.nan],
+                "weight": [13.0, 80.0, 10.0, 13.0],
+            }
+        )
+        z_df = sumstats.calculate_modified_zscore_pediatrics(
+            merged_df, self.df, "weight"
+        )
+        self.assertNotIn("agemos", merged_df.columns)
+        self.assertAlmostEqual(0.08178425962912818, z_df["wtz"].iloc[0])
+        # Ages off the growth chart, or missing, have no z score
+        self.assertTrue(z_df["wtz"].iloc[1:].isnull().all())
+        # Tables that were not prepared up front are prepared on the fly
+        raw_z_df = sumstats.calculate_modified_zscore_pediatrics(
+            merged_df, self.df.drop(columns=["half_of_two_z_scores"]), "weight"
+        )
+        pd.testing.assert_series_equal(z_df["wtz"], raw_z_df["wtz"])